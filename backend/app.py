@@ -5,16 +5,66 @@
 # - Unified MBTA helpers; safe, no duplicate Flask endpoints
 
 import os
+import sys
+import atexit
+import signal
+import calendar
 import time
+import queue
+import logging
+import logging.handlers
+import random
 import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import serial
 import serial.tools.list_ports
+from collections import OrderedDict, deque
+from types import MappingProxyType
 from datetime import datetime, timezone
+from functools import lru_cache
+from bisect import bisect_left
 from flask import Flask, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import uuid
+import hashlib
 import json
+from concurrent.futures import Future, ThreadPoolExecutor
+
+try:
+    import orjson  # optional: faster JSON encode/decode
+except ImportError:
+    orjson = None
+
+try:
+    import ciso8601  # optional: C ISO-8601 parser for prediction timestamps
+except ImportError:
+    ciso8601 = None
+
+# ==============================
+# Logging
+# ==============================
+# Callers only enqueue records; a QueueListener thread does formatting + stderr I/O.
+# LOG_LEVEL overrides; default is WARNING, or INFO under FLASK_DEBUG=1.
+log = logging.getLogger("buzzband")
+log.setLevel((os.getenv("LOG_LEVEL") or ("INFO" if os.getenv("FLASK_DEBUG") == "1" else "WARNING")).upper())
+log.propagate = False
+_log_q = queue.SimpleQueue()
+log.addHandler(logging.handlers.QueueHandler(_log_q))
+_log_listener = logging.handlers.QueueListener(_log_q, logging.StreamHandler())
+_log_listener.start()
+atexit.register(_log_listener.stop)  # flush records still queued at exit
+
+def _json_loads(data):
+    return orjson.loads(data) if orjson else json.loads(data)
+
+def _json_dumpb(obj) -> bytes:
+    """JSON straight to bytes (orjson skips the str round-trip)."""
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(obj, sort_keys=True, separators=(",", ":")).encode()
 
 # ==============================
 # Config
@@ -22,6 +72,20 @@ import json
 API_KEY = os.getenv("MBTA_API_KEY", "")
 HEADERS = {"x-api-key": API_KEY} if API_KEY else {}
 
+# One pooled keep-alive session for every MBTA call (skips a TCP+TLS handshake per call);
+# Retry backs off on 429/5xx. Shared across threads: plain GETs only, no per-call session state.
+MBTA_SESSION = requests.Session()
+MBTA_SESSION.headers.update(HEADERS)
+MBTA_SESSION.headers["Accept-Encoding"] = "gzip"
+MBTA_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,   # poller + stream + waitress handler threads
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504]),
+))
+# (connect, read) seconds for plain MBTA GETs: fail fast on a dead route instead of
+# holding the poll thread for the old flat 12s per attempt
+MBTA_TIMEOUT = (3.05, 8)
+
 
 # UI thresholds (simple badge)ta
 NEARBY_THRESHOLD_SEC   = int(os.getenv("NEARBY_THRESHOLD_SEC", "720"))   # 12 min
@@ -40,79 +104,187 @@ DEST_STOP_THRESHOLD         = int(os.getenv("DEST_STOP_THRESHOLD", "240"))
 # Default stops (env-overridable)
 ORIGIN_STOP  = os.getenv("ORIGIN_STOP", "place-babck")   # Babcock St (Green-B)
 DEST_STOP    = os.getenv("DEST_STOP",   "70147")         # BU East (bus example)
+# Live (origin, dest) pair. /config rebinds the whole tuple, so readers that unpack it
+# once never see a new origin with an old dest.
+STOPS = (ORIGIN_STOP, DEST_STOP)
 
-POLL_INTERVAL = int(os.getenv("POLL_INTERVAL", "10"))    # seconds
+POLL_INTERVAL = int(os.getenv("POLL_INTERVAL", "10"))    # seconds (upper bound; see _next_poll_delay)
+MIN_POLL_INTERVAL = 2                                     # seconds, floor near the thresholds
+
+# MBTA streaming (SSE) — poller falls back to plain HTTP polling if the stream keeps failing
+USE_STREAM          = os.getenv("USE_STREAM", "1") == "1"
+STREAM_MAX_FAILURES = int(os.getenv("STREAM_MAX_FAILURES", "3"))
+
+# KeyRoute sessions
+SESSION_TTL_SEC         = int(os.getenv("SESSION_TTL_SEC", str(6 * 3600)))
+SESSION_ARRIVED_TTL_SEC = int(os.getenv("SESSION_ARRIVED_TTL_SEC", "300"))
+SESSION_MAX             = int(os.getenv("SESSION_MAX", "10000"))
 
 # Arduino
 BAUD_RATE = int(os.getenv("BAUD_RATE", "115200"))
+SIM_MODE  = os.getenv("SIM_MODE", "0") == "1"   # force simulated device (no serial I/O)
+SERIAL_Q_MAX = int(os.getenv("SERIAL_Q_MAX", "64"))
+# seconds; must outlast the longest blocking alert on the sketch (~8 s) so a busy board isn't mistaken for a dead one
+SERIAL_WRITE_TIMEOUT = float(os.getenv("SERIAL_WRITE_TIMEOUT", "10"))
 arduino_connection: serial.Serial | None = None
+sim_last_cmd = None  # last command "sent" while simulated (for /sim)
+last_write_mode = None  # "arduino" | "sim" | "sim-fallback" for the last write (guarded by _serial_lock)
 
 # =======================
 # Shared state for UI
 # =======================
-current_status    = "IDLE"  # IDLE | NEARBY | APPROACH | STOP
-last_origin_secs  = None
-last_dest_secs    = None
-last_trip_id      = None
-last_updated_iso  = None
-event_log         = []      # recent events for /events
-last_origin_alert = "IDLE"  # ORIGIN_NEARBY/APPROACH/STOP/URGENT/IDLE
-last_dest_alert   = "IDLE"  # DEST_NEARBY/APPROACH/STOP/URGENT/IDLE
+# The poller publishes each tick as a fresh dict (rebind, never mutate), so request
+# handlers read STATE lock-free and always see one consistent tick.
+STATE = {
+    "status":       "IDLE",  # IDLE | NEARBY | APPROACH | STOP
+    "origin_secs":  None,
+    "dest_secs":    None,
+    "trip_id":      None,
+    "last_updated": None,
+    "origin_alert": "IDLE",  # ORIGIN_NEARBY/APPROACH/STOP/URGENT/IDLE
+    "dest_alert":   "IDLE",  # DEST_NEARBY/APPROACH/STOP/URGENT/IDLE
+}
+_state_lock = threading.Lock()  # serializes writers only
+_state_cv   = threading.Condition(_state_lock)  # notified on every publish (/events/stream)
+event_log   = deque(maxlen=200)  # recent events for /events
+
+def _status_etag(st):
+    """/status validator, computed once per publish so a 304 needs no encode."""
+    key = f'{st["last_updated"]}|{st["status"]}|{st["origin_secs"]}|{st["dest_secs"]}|{st["trip_id"]}'
+    return hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+
+STATE["etag"] = _status_etag(STATE)
+
+def _publish_state(**changes):
+    global STATE
+    with _state_lock:
+        st = {**STATE, **changes}
+        st["etag"] = _status_etag(st)
+        STATE = st
+        _state_cv.notify_all()
 
 def _log_event(kind, payload):
-    global event_log
     event_log.append({
         "ts": datetime.now(timezone.utc).isoformat(),
         "kind": kind,
         "payload": payload,
     })
-    if len(event_log) > 200:
-        event_log = event_log[-200:]
 
 # =======================
 # Arduino helpers
 # =======================
+# Fixed .ino vocabulary, encoded once at import
+_CMD_CACHE: dict[str, bytes] = {c: (c + "\n").encode() for c in (
+    "IDLE", "URGENT", "STATUS_UPDATE",
+    "LED_STATUS_ORIGIN", "LED_STATUS_DEST", "LED_STATUS_NONE",
+    "ORIGIN_NEARBY", "ORIGIN_APPROACH", "ORIGIN_STOP",
+    "DEST_NEARBY", "DEST_APPROACH", "DEST_STOP",
+)}
+
+def _encode_cmd(line: str) -> bytes:
+    return _CMD_CACHE.get(line) or b"%s\n" % line.strip().encode()
+
+_ARDUINO_DESC_KEYS = frozenset(("arduino", "nano", "esp32", "cp210", "silicon labs", "wch", "ch340", "usb-serial"))
+_ARDUINO_DEV_KEYS  = frozenset(("usbmodem", "usbserial"))
+# USB vendor ids: boards that enumerate as themselves vs. common USB-serial bridge chips
+_BOARD_VIDS  = frozenset((0x2341, 0x2A03, 0x303A))          # Arduino, Arduino.org, Espressif
+_BRIDGE_VIDS = frozenset((0x10C4, 0x1A86, 0x0403))          # Silicon Labs CP210x, WCH CH340, FTDI
+_PORT_CACHE_TTL    = 30.0   # memoize scans so a boot-looping board doesn't trigger an enumeration storm
+_port_cache = {"device": None, "ts": 0.0}
+_last_good_port = None      # last port we actually opened; tried before enumerating again
+
+def _port_sort_key(dev):
+    # prefer /dev/cu.* on macOS, then alphabetical
+    return ("/cu." not in dev, dev)
+
 def find_arduino_port():
+    """Cached wrapper around _scan_arduino_port (enumerating ports is slow on macOS/Windows)."""
+    now = time.monotonic()
+    if now - _port_cache["ts"] < _PORT_CACHE_TTL and _port_present(_port_cache["device"]):
+        return _port_cache["device"]
+    ports = list(serial.tools.list_ports.comports())
+    cached = _port_cache["device"]
+    if cached and cached == _last_good_port and any(p.device == cached for p in ports):
+        device = cached  # opened fine last time and still plugged in; skip the heuristics
+    else:
+        device = _scan_arduino_port(ports)
+    _port_cache.update(device=device, ts=now)
+    return device
+
+def _port_present(device):
+    """Cheap liveness check for a cached port: the /dev node must still exist (COMx can't be stat'd)."""
+    if device is None or not device.startswith("/dev/"):
+        return True
+    return os.path.exists(device)
+
+def _invalidate_port_cache():
+    global _last_good_port
+    _last_good_port = None
+    _port_cache.update(device=None, ts=0.0)
+
+def _scan_arduino_port(ports=None):
     """Find likely Arduino/Nano/ESP32 serial port across OSes (robust)."""
+    if ports is None:
+        ports = list(serial.tools.list_ports.comports())
     candidates = []
-    for p in serial.tools.list_ports.comports():
+    for p in ports:
         desc = (p.description or "").lower()
         hwid = (p.hwid or "").lower()
         dev  = (p.device or "")
+        dev_l = dev.lower()
 
-        # Common matches by description or hwid
-        if any(k in desc for k in [
-            "arduino", "nano", "esp32", "cp210", "silicon labs", "wch", "ch340", "usb-serial"
-        ]) or "esp32" in hwid:
-            candidates.append(dev)
+        # Strong match → done (skip macOS /dev/tty.* twins; we prefer /dev/cu.*)
+        if ((p.vid in _BOARD_VIDS or "arduino" in desc or "usbmodem" in dev_l)
+                and "/tty." not in dev):
+            return dev
 
-        # macOS device name hints
-        if any(k in dev.lower() for k in ["usbmodem", "usbserial"]):
+        # USB-serial bridge chips by VID, then description/hwid/macOS device name hints
+        if (p.vid in _BRIDGE_VIDS or any(k in desc for k in _ARDUINO_DESC_KEYS) or "esp32" in hwid
+                or any(k in dev_l for k in _ARDUINO_DEV_KEYS)):
             candidates.append(dev)
 
     # De-dup & prefer /dev/cu.* on macOS (if present)
-    seen = set()
-    ordered = []
-    for c in candidates:
-        if c not in seen:
-            seen.add(c); ordered.append(c)
-    ordered = sorted(ordered, key=lambda d: ("/cu." not in d, d))
+    ordered = sorted(dict.fromkeys(candidates), key=_port_sort_key)
     if ordered:
         return ordered[0]
 
     # Fallback: first enumerated port if nothing matched
-    ports = list(serial.tools.list_ports.comports())
     return ports[0].device if ports else None
 
+def _open_serial(port):
+    # write_timeout: a stalled/unplugged device raises instead of blocking the writer thread
+    conn = serial.Serial(port, BAUD_RATE, timeout=1, write_timeout=SERIAL_WRITE_TIMEOUT)
+    try:
+        # FTDI/USB-serial on Linux: drop the driver's 16 ms latency timer so short
+        # command frames go out immediately. Unsupported elsewhere; best-effort only.
+        conn.set_low_latency_mode(True)
+    except (AttributeError, NotImplementedError, ValueError, OSError):
+        pass
+    return conn
+
 def connect_to_arduino(wait_ready=True):
     """Connect (or reconnect) to Arduino, optionally waiting for sketch banner."""
-    global arduino_connection
-    port = find_arduino_port()
+    global arduino_connection, _last_good_port
+    port = _last_good_port
+    if port is not None and not _port_present(port):
+        _invalidate_port_cache()
+        port = None
+    if port is not None:
+        try:
+            arduino_connection = _open_serial(port)
+        except Exception as e:
+            log.info("Last-good port %s failed (%s); rescanning", port, e)
+            _invalidate_port_cache()
+            port = None
     if port is None:
-        print("Arduino not found.")
-        return False
+        port = find_arduino_port()
+        if port is None:
+            log.warning("Arduino not found.")
+            return False
     try:
-        arduino_connection = serial.Serial(port, BAUD_RATE, timeout=1)
+        if port != _last_good_port:
+            arduino_connection = _open_serial(port)
+        _last_good_port = port
         # allow board reboot after opening serial
         time.sleep(1.5)
         if wait_ready:
@@ -123,141 +295,363 @@ def connect_to_arduino(wait_ready=True):
                 except Exception:
                     line = ""
                 if line:
-                    # Uncomment to debug: print(f"[Serial] {line}")
+                    # Uncomment to debug: log.debug("[Serial] %s", line)
                     if ("Transit Keychain Ready" in line) or ("Starting Transit Keychain" in line) or ("READY" in line):
                         break
-        print(f"Connected to Arduino on {port} @ {BAUD_RATE} baud")
+        log.info("Connected to Arduino on %s @ %d baud", port, BAUD_RATE)
+        _reset_sent_state()  # the board reset on open; it has no LED status yet
+        _invalidate_health()
         return True
     except Exception as e:
-        print(f"Failed to connect to Arduino: {e}")
+        log.error("Failed to connect to Arduino: %s", e)
         arduino_connection = None
+        _invalidate_port_cache()  # the memoized scan pointed at a dead port; rescan next time
+        _invalidate_health()
+        return False
+
+_reconnect_state = {"attempt": 0, "next_try": 0.0}
+
+def _try_reconnect():
+    """connect_to_arduino, throttled with exponential backoff + jitter while the device is missing."""
+    if time.monotonic() < _reconnect_state["next_try"]:
         return False
+    if connect_to_arduino(wait_ready=True):
+        _reconnect_state.update(attempt=0, next_try=0.0)
+        return True
+    delay = min(60, 2 ** _reconnect_state["attempt"] + random.uniform(0, 1))
+    _reconnect_state["next_try"] = time.monotonic() + delay
+    _reconnect_state["attempt"] += 1
+    return False
+
+_serial_lock = threading.Lock()  # one writer on the port at a time (writer thread vs. self-test)
+
+def _raw_write(line: str, msg: bytes = None):
+    """Low-level write with SIM and auto-fallback; logs to /events. msg: pre-encoded bytes for line."""
+    with _serial_lock:
+        _raw_write_locked(line, msg)
 
-def _arduino_write(line: str) -> bool:
-    """Low-level write with SIM and auto-fallback; logs to /events."""
-    global arduino_connection, sim_last_cmd, SIM_MODE
+def _raw_write_locked(line: str, msg: bytes = None):
+    """Never fails: falls back to SIM; last_write_mode says where the line went."""
+    global arduino_connection, sim_last_cmd, SIM_MODE, last_write_mode
     msg_txt = line.strip()
-    msg = (msg_txt + "\n").encode()
+    if msg is None:
+        msg = _encode_cmd(msg_txt)
 
     try:
         # Forced SIM mode
         if SIM_MODE:
             sim_last_cmd = {"ts": datetime.now(timezone.utc).isoformat(), "cmd": msg_txt}
             _log_event("sim_cmd", {"send": msg_txt})
-            print(f"[SIM] {msg_txt}")
-            return True
+            log.debug("[SIM] %s", msg_txt)
+            last_write_mode = "sim"
+            return
 
         # Try real hardware
         if not (arduino_connection and arduino_connection.is_open):
-            if not connect_to_arduino(wait_ready=True):
+            if not _try_reconnect():
                 # Auto-fallback to SIM if not found
                 sim_last_cmd = {"ts": datetime.now(timezone.utc).isoformat(), "cmd": msg_txt}
                 _log_event("sim_cmd", {"send": msg_txt, "note": "auto-fallback-no-device"})
-                print(f"[SIM-fallback] {msg_txt}")
-                return True
+                log.info("[SIM-fallback] %s", msg_txt)
+                last_write_mode = "sim-fallback"
+                return
 
         arduino_connection.write(msg)
         _log_event("arduino_cmd", {"send": msg_txt})
-        return True
+        last_write_mode = "arduino"
 
     except Exception as e:
-        print(f"Arduino write failed: {e}")
+        log.error("Arduino write failed: %s", e)
+        if isinstance(e, serial.SerialException) and not isinstance(e, serial.SerialTimeoutException):
+            # Device went away (unplugged/re-enumerated); don't trust the cached port on reconnect
+            _invalidate_port_cache()
+        if arduino_connection is not None:
+            try:
+                arduino_connection.close()
+            except Exception:
+                pass
         arduino_connection = None
+        _reset_sent_state()
+        _invalidate_health()
         # Auto-fallback to SIM on error
         sim_last_cmd = {"ts": datetime.now(timezone.utc).isoformat(), "cmd": msg_txt}
         _log_event("sim_cmd", {"send": msg_txt, "note": "auto-fallback-error"})
-        print(f"[SIM-fallback after error] {msg_txt}")
-        return True
+        log.info("[SIM-fallback after error] %s", msg_txt)
+        last_write_mode = "sim-fallback"
+
+# Alert commands go through a bounded queue drained by _serial_writer, so the
+# poll loop never blocks on USB-serial. Whatever is queued when the writer wakes
+# goes out as one newline-joined frame.
+_serial_q  = deque()
+_serial_cv = threading.Condition()
+SERIAL_DEDUPE_SEC = 0.5
+_DEDUPE_PREFIXES  = ("ORIGIN_", "DEST_", "IDLE")
+_last_enqueued    = {"cmd": None, "ts": 0.0}  # guarded by _serial_cv
+_writer_state     = {"last_sent": None}       # owned by _serial_writer; cleared by _reset_sent_state
+
+def _enqueue_cmds(cmds):
+    """Queue commands for the writer thread (atomically, so they share a frame); drops oldest when full."""
+    with _serial_cv:
+        if any(c.startswith("LED_STATUS_") for c in cmds):
+            # A newer LED orientation supersedes any still waiting
+            for queued in [c for c in _serial_q if c.startswith("LED_STATUS_")]:
+                _serial_q.remove(queued)
+        now = time.monotonic()
+        for cmd in cmds:
+            # Drop an alert/IDLE identical to the previous command within the dedupe window
+            # (double-clicked /buzz etc.); BUZZ is parameterized and always goes through.
+            if (cmd == _last_enqueued["cmd"] and now - _last_enqueued["ts"] < SERIAL_DEDUPE_SEC
+                    and cmd.startswith(_DEDUPE_PREFIXES)):
+                continue
+            _last_enqueued.update(cmd=cmd, ts=now)
+            if len(_serial_q) >= SERIAL_Q_MAX:
+                _serial_q.popleft()
+            _serial_q.append(cmd)
+        _serial_cv.notify()
 
-def send_alert(command: str):
-    ok = _arduino_write(command)
-    if ok:
-        print(f"🔔 ALERT → {command}")
-    else:
-        print(f"❌ ALERT send failed → {command}")
+def _enqueue_cmd(cmd: str):
+    _enqueue_cmds((cmd,))
 
-def send_urgent_alert():
-    send_alert("URGENT")
+def _serial_writer():
+    """Drain the command queue onto the device (or SIM), one frame per wake-up."""
+    while True:
+        with _serial_cv:
+            while not _serial_q:
+                _serial_cv.wait()
+            pending = list(_serial_q)
+            _serial_q.clear()
+
+        frame = []
+        for cmd in pending:
+            if cmd == _writer_state["last_sent"] and cmd.startswith("LED_STATUS_"):
+                continue
+            frame.append(cmd)
+            _writer_state["last_sent"] = cmd
+        if frame:
+            _arduino_write_many(frame)
+
+def _arduino_write_many(lines):
+    """Several commands in a single serial write (the sketch splits on newlines)."""
+    # Join cached per-line bytes rather than encoding the joined text (a frame never hits the cache)
+    _raw_write("\n".join(lines), b"".join(map(_encode_cmd, lines)))
+
+_last_led_cmd: str | None = None
+
+def _led_status_cmd(origin_secs, dest_secs):
+    """LED_STATUS_* for whichever side is sooner/available, or None if unchanged since last sent."""
+    global _last_led_cmd
+    if origin_secs is not None and dest_secs is not None:
+        target = "LED_STATUS_ORIGIN" if origin_secs < dest_secs else "LED_STATUS_DEST"
+    elif origin_secs is not None:
+        target = "LED_STATUS_ORIGIN"
+    elif dest_secs is not None:
+        target = "LED_STATUS_DEST"
+    else:
+        target = "LED_STATUS_NONE"
+    if target == _last_led_cmd:
+        return None
+    _last_led_cmd = target
+    return target
 
-def send_status_update():
-    send_alert("STATUS_UPDATE")
+def _reset_sent_state():
+    """Forget what the device was last told, so the next LED_STATUS_* is sent again."""
+    global _last_led_cmd
+    _last_led_cmd = None
+    _writer_state["last_sent"] = None
 
-def send_led_status_update(origin_secs, dest_secs):
-    """Send LED_STATUS_* based on which side is sooner/available."""
-    try:
-        if origin_secs is not None and dest_secs is not None:
-            if origin_secs < dest_secs:
-                send_alert("LED_STATUS_ORIGIN")
-            else:
-                send_alert("LED_STATUS_DEST")
-        elif origin_secs is not None:
-            send_alert("LED_STATUS_ORIGIN")
-        elif dest_secs is not None:
-            send_alert("LED_STATUS_DEST")
-        else:
-            send_alert("LED_STATUS_NONE")
-    except Exception as e:
-        print(f"LED status update error: {e}")
+# Tone flourish on transitions; the sketch plays each BUZZ before reading the next line,
+# so no Python-side pacing is needed.
+_DOORBELL_LINES = ("BUZZ 880 120", "BUZZ 988 120", "BUZZ 1175 180")
+_CMD_CACHE.update({c: (c + "\n").encode() for c in _DOORBELL_LINES})
 
 def _doorbell():
-    """Optional tiny tone flourish on transitions (safe if simulated)."""
-    try:
-        _arduino_write("BUZZ 880 120"); time.sleep(0.05)
-        _arduino_write("BUZZ 988 120"); time.sleep(0.05)
-        _arduino_write("BUZZ 1175 180")
-    except Exception:
-        pass
+    """Optional tiny tone flourish on transitions; returned as lines for the caller's frame."""
+    return list(_DOORBELL_LINES)
 
 # =======================
 # MBTA helpers
 # =======================
-def get_predictions_for_stop(stop_id, limit=8):
+# TTL cache in front of MBTA GETs, keyed on (path, params). Misses for the same key are
+# single-flighted (one in-flight Future per key) so the poller and concurrent handlers
+# share one upstream call.
+# Keep the predictions TTL short: the poller speeds up to MIN_POLL_INTERVAL near arrival
+MBTA_CACHE_TTL = {"/predictions": float(os.getenv("PREDICTIONS_CACHE_TTL", "5")), "/stops": 600}  # seconds, by path
+# Stale-while-error: if the refetch fails, an expired entry this recent (past expiry) is served instead
+MBTA_STALE_GRACE = {"/predictions": 60, "/stops": 86400}
+MBTA_CACHE_MAX = 256
+_mbta_cache: "OrderedDict[tuple, tuple[float, dict]]" = OrderedDict()  # key -> (expiry, body)
+_mbta_cache_lock = threading.RLock()
+_mbta_inflight: dict[tuple, Future] = {}
+
+def _mbta_cached(path, params, fetch):
+    """
+    Return fetch() through the TTL cache. While a fetch for a key is in flight, other
+    callers wait on its Future and get the same body (or the same exception).
+    A failed refetch falls back to the expired body within MBTA_STALE_GRACE.
+    """
+    ttl = MBTA_CACHE_TTL.get(path, 0)
+    key = (path, tuple(sorted(params.items())))
+
+    with _mbta_cache_lock:
+        hit = _mbta_cache.get(key)
+        if hit and time.monotonic() < hit[0]:
+            return hit[1]
+        fut = _mbta_inflight.get(key)
+        leader = fut is None
+        if leader:
+            fut = _mbta_inflight[key] = Future()
+
+    if not leader:
+        return fut.result()
+
+    try:
+        body = fetch()
+    except Exception as e:
+        stale = hit and time.monotonic() < hit[0] + MBTA_STALE_GRACE.get(path, 0)
+        with _mbta_cache_lock:
+            _mbta_inflight.pop(key, None)
+        if stale:
+            log.warning("MBTA %s failed (%s); serving stale cached body", path, e)
+            fut.set_result(hit[1])
+            return hit[1]
+        fut.set_exception(e)
+        raise
+    except BaseException as e:
+        with _mbta_cache_lock:
+            _mbta_inflight.pop(key, None)
+        fut.set_exception(e)
+        raise
+
+    with _mbta_cache_lock:
+        if ttl > 0:
+            _mbta_cache[key] = (time.monotonic() + ttl, body)
+            _mbta_cache.move_to_end(key)
+            while len(_mbta_cache) > MBTA_CACHE_MAX:
+                _mbta_cache.popitem(last=False)
+        _mbta_inflight.pop(key, None)
+    fut.set_result(body)
+    return body
+
+# Shared read-only stand-in for missing JSON:API objects (no throwaway {} per lookup)
+_EMPTY = MappingProxyType({})
+
+# Validators + last body per predictions query, for If-None-Match / If-Modified-Since
+_etags: dict[str, str] = {}
+_last_modified: dict[str, str] = {}
+_last_bodies: dict[str, dict] = {}
+_last_fetch = {"ts": None, "status": None}  # last upstream predictions hit (cache misses only); shown in /health
+
+def get_predictions_for_stops(stop_ids, limit=20):
+    """One /predictions call for several stops (comma-separated filter[stop])."""
     url = "https://api-v3.mbta.com/predictions"
-    params = {"filter[stop]": stop_id, "sort": "arrival_time", "page[limit]": limit}
-    resp = requests.get(url, headers=HEADERS, params=params, timeout=12)
+    params = {
+        "filter[stop]": ",".join(stop_ids),
+        "sort": "arrival_time",
+        "page[limit]": limit,
+        "include": "stop",   # needed to roll platform stops up to their parent station
+    }
+    return _mbta_cached("/predictions", params, lambda: _fetch_predictions(url, params))
+
+def _fetch_predictions(url, params):
+    # Conditional GET: unchanged predictions come back as an empty 304
+    key = f"{params['filter[stop]']}|{params['page[limit]']}"
+    headers = {}
+    if key in _last_bodies:
+        if _etags.get(key):
+            headers["If-None-Match"] = _etags[key]
+        if _last_modified.get(key):
+            headers["If-Modified-Since"] = _last_modified[key]
+
+    resp = MBTA_SESSION.get(url, params=params, headers=headers, timeout=MBTA_TIMEOUT)
+    _last_fetch["ts"] = datetime.now(timezone.utc).isoformat()
+    _last_fetch["status"] = resp.status_code
+    if resp.status_code == 304 and key in _last_bodies:
+        return _last_bodies[key]
     resp.raise_for_status()
-    return resp.json()
+    body = _json_loads(resp.content)
+    _etags[key]         = resp.headers.get("ETag")
+    _last_modified[key] = resp.headers.get("Last-Modified")
+    _last_bodies[key]   = body
+    return body
+
+def _bucket_by_stop(raw, stop_ids):
+    """
+    Split a multi-stop predictions payload into { stop_id: [items] }.
+    Parent stations (place-*) come back as child platform ids, so those are mapped
+    back through the included stop's parent_station.
+    """
+    parents = {}
+    for inc in raw.get("included", []):
+        if inc.get("type") != "stop":
+            continue
+        parent = ((inc.get("relationships") or _EMPTY).get("parent_station") or _EMPTY).get("data") or _EMPTY
+        parents[inc.get("id")] = parent.get("id")
+
+    buckets = {sid: [] for sid in stop_ids}
+    for item in raw.get("data", []):
+        rels = item.get("relationships") or _EMPTY
+        sid  = ((rels.get("stop") or _EMPTY).get("data") or _EMPTY).get("id")
+        if sid in buckets:
+            buckets[sid].append(item)
+        elif parents.get(sid) in buckets:
+            buckets[parents[sid]].append(item)
+    return buckets
+
+def _iso_to_epoch(s):
+    """
+    Fixed-width fast path for MBTA's 'YYYY-MM-DDTHH:MM:SS±HH:MM' (or trailing 'Z'):
+    integer slicing + calendar.timegm, no datetime/tzinfo objects. None if the shape differs.
+    """
+    n = len(s)
+    if n == 25 and s[19] in "+-":
+        off = int(s[20:22]) * 3600 + int(s[23:25]) * 60
+        if s[19] == "+":
+            off = -off
+    elif n == 20 and s[19] == "Z":
+        off = 0
+    else:
+        return None
+    return float(calendar.timegm((int(s[0:4]), int(s[5:7]), int(s[8:10]),
+                                  int(s[11:13]), int(s[14:16]), int(s[17:19]), 0, 0, 0)) + off)
 
-def parse_time(timestr):
+@lru_cache(maxsize=4096)
+def _parse_epoch(timestr):
+    """
+    MBTA ISO-8601 timestamp → epoch seconds (no UTC-converted datetime kept around).
+    Memoized: the same arrival strings repeat across polls and origin/dest rows.
+    """
     if not timestr:
         return None
     try:
-        # Handle trailing Z and timezone normalize
-        return datetime.fromisoformat(timestr.replace("Z","+00:00")).astimezone(timezone.utc)
+        if ciso8601:
+            return ciso8601.parse_datetime(timestr).timestamp()
+        ts = _iso_to_epoch(timestr)
+        if ts is not None:
+            return ts
+        return datetime.fromisoformat(timestr.replace("Z", "+00:00")).timestamp()
     except Exception:
         return None
 
-def time_until(dt):
-    if not dt:
-        return None
-    return (dt - datetime.now(timezone.utc)).total_seconds()
-
-def _normalize_predictions(stop_id, limit=8):
-    """
-    Return sorted list of upcoming predictions at a stop with keys:
-    { 'ts': datetime (arrival or departure), 'secs': float, 'trip_id': str|None, 'direction_id': int|None }
-    """
-    raw = get_predictions_for_stop(stop_id, limit=limit)
-    now = datetime.now(timezone.utc)
+def _normalize_raw(items, now):
+    """Sorted upcoming rows {epoch, secs, trip_id, direction_id} from raw MBTA prediction items."""
+    now_ts = now.timestamp()  # float math per row instead of a timedelta per row
     rows = []
-    for item in raw.get("data", []):
-        attrs = item.get("attributes", {}) or {}
-        rels  = item.get("relationships", {}) or {}
-        trip  = (rels.get("trip", {}) or {}).get("data", {}) or {}
+    for item in items:
+        attrs = item.get("attributes") or _EMPTY
+        rels  = item.get("relationships") or _EMPTY
+        trip  = (rels.get("trip") or _EMPTY).get("data") or _EMPTY
         trip_id = trip.get("id")
         direction_id = attrs.get("direction_id")
 
-        at = parse_time(attrs.get("arrival_time"))
-        dt = parse_time(attrs.get("departure_time"))
-        ts = at or dt
+        ts = _parse_epoch(attrs.get("arrival_time")) or _parse_epoch(attrs.get("departure_time"))
         if not ts:
             continue
-        secs = (ts - now).total_seconds()
+        secs = ts - now_ts
         if secs <= 0:
             continue
 
         rows.append({
-            "ts": ts,
+            "epoch": ts,
             "secs": secs,
             "trip_id": trip_id,
             "direction_id": direction_id
@@ -265,115 +659,312 @@ def _normalize_predictions(stop_id, limit=8):
     rows.sort(key=lambda r: r["secs"])
     return rows
 
-def match_origin_dest_by_trip(origin_stop, dest_stop):
+def _item_epoch(item):
+    """Arrival (else departure) epoch of a prediction item, or None."""
+    attrs = item.get("attributes") or _EMPTY
+    return _parse_epoch(attrs.get("arrival_time")) or _parse_epoch(attrs.get("departure_time"))
+
+def _first_future_secs(items, now):
+    """
+    Soonest upcoming prediction as (secs, trip_id, direction_id), or None.
+    Single pass with no row list or sort; a min rather than the first hit because
+    streamed items arrive in event order, not arrival order.
+    """
+    now_ts = now.timestamp()
+    best = None
+    for item in items:
+        ts = _item_epoch(item)
+        if not ts:
+            continue
+        secs = ts - now_ts
+        if secs <= 0 or (best and secs >= best[0]):
+            continue
+        trip = ((item.get("relationships") or _EMPTY).get("trip") or _EMPTY).get("data") or _EMPTY
+        best = (secs, trip.get("id"), (item.get("attributes") or _EMPTY).get("direction_id"))
+    return best
+
+def match_origin_dest_by_trip(origin_stop, dest_stop, now=None):
     """
     Pick the next upcoming origin prediction, then find the matching destination prediction by trip_id
     so ETAs are consistent for the same vehicle.
+    Both stops are fetched in a single MBTA request and split locally.
     Returns (origin_secs, dest_secs, trip_id) — any may be None if not found.
     """
-    origin_rows = _normalize_predictions(origin_stop, limit=8)
-    dest_rows   = _normalize_predictions(dest_stop,   limit=12)
+    raw = get_predictions_for_stops([origin_stop, dest_stop], limit=20)
+    return _match_raw(raw, origin_stop, dest_stop, now)
+
+def _match_raw(raw, origin_stop, dest_stop, now=None):
+    """Trip matching over an already-fetched (or streamed) multi-stop payload."""
+    buckets = _bucket_by_stop(raw, [origin_stop, dest_stop])
+    now = now or datetime.now(timezone.utc)
+
+    # Nothing to match against at dest → only the next origin arrival matters
+    if not buckets[dest_stop]:
+        first = _first_future_secs(buckets[origin_stop], now)
+        return (int(first[0]), None, first[1]) if first else (None, None, None)
+
+    origin_rows = _normalize_raw(buckets[origin_stop], now)
+    dest_rows   = _normalize_raw(buckets[dest_stop],   now)
 
     if not origin_rows:
         return (None, None, None)
 
-    # Try each candidate at origin until we find a matching trip at dest
-    for o in origin_rows:
-        trip_id = o["trip_id"]
-        if not trip_id:
-            continue
+    # trip_id -> soonest dest row (reversed so the earliest row wins)
+    dest_by_trip = {d["trip_id"]: d for d in reversed(dest_rows) if d["trip_id"]}
+
+    # Try each candidate at origin (trip-less rows can't match) until one matches at dest
+    for o in [o for o in origin_rows if o["trip_id"]]:
         # same trip_id (and typically same direction_id)
-        match = next((d for d in dest_rows if d["trip_id"] == trip_id), None)
+        match = dest_by_trip.get(o["trip_id"])
         if match:
-            return (int(o["secs"]), int(match["secs"]), trip_id)
+            return (int(o["secs"]), int(match["secs"]), o["trip_id"])
 
     # If no direct match, return the next origin and leave dest as None
     return (int(origin_rows[0]["secs"]), None, origin_rows[0]["trip_id"])
 
+# =======================
+# MBTA event stream (SSE)
+# =======================
+# Live copy of the origin/dest predictions, patched by reset/add/update/remove events.
+_stream_cache = {"key": None, "live": False, "predictions": {}, "stops": {}}
+_stream_lock  = threading.Lock()
+_stream_wake  = threading.Event()   # set on every applied event so the poller recomputes right away
+
+def _stream_live(origin_stop, dest_stop):
+    with _stream_lock:
+        return _stream_cache["live"] and _stream_cache["key"] == (origin_stop, dest_stop)
+
+def _stream_snapshot():
+    """Cached predictions in the same shape as a /predictions response body."""
+    with _stream_lock:
+        return {
+            "data": list(_stream_cache["predictions"].values()),
+            "included": list(_stream_cache["stops"].values()),
+        }
+
+def _apply_stream_event(event, payload):
+    with _stream_lock:
+        preds = _stream_cache["predictions"]
+        stops = _stream_cache["stops"]
+        if event == "reset":
+            preds.clear(); stops.clear()
+            items = payload
+        elif event in ("add", "update"):
+            items = [payload]
+        elif event == "remove":
+            (preds if payload.get("type") == "prediction" else stops).pop(payload.get("id"), None)
+            return
+        else:
+            return
+        for item in items:
+            if item.get("type") == "prediction":
+                preds[item["id"]] = item
+            elif item.get("type") == "stop":
+                stops[item["id"]] = item
+
+def _consume_stream(origin_stop, dest_stop, seen):
+    """
+    Follow /predictions as text/event-stream until the configured stops change.
+    Raises on any HTTP/stream error; seen["events"] counts events applied on this connection.
+    """
+    url = "https://api-v3.mbta.com/predictions"
+    params = {"filter[stop]": f"{origin_stop},{dest_stop}", "include": "stop"}
+    headers = {"Accept": "text/event-stream"}
+    with MBTA_SESSION.get(url, headers=headers, params=params, stream=True, timeout=(10, 60)) as resp:
+        resp.raise_for_status()
+        with _stream_lock:
+            _stream_cache.update(key=(origin_stop, dest_stop), live=False, predictions={}, stops={})
+
+        event, data = None, []
+        for line in resp.iter_lines(decode_unicode=True):
+            if STOPS != (origin_stop, dest_stop):
+                return  # /config switched stops; reconnect with the new filter
+            if line:
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    data.append(line[5:].strip())
+                continue  # ':' lines are keep-alive comments
+
+            # Blank line terminates one event
+            if event and data:
+                _apply_stream_event(event, _json_loads("\n".join(data)))
+                with _stream_lock:
+                    _stream_cache["live"] = True
+                seen["events"] += 1
+                _stream_wake.set()
+            event, data = None, []
+
+def stream_loop():
+    """Keep the stream cache fresh; reconnect with backoff, give up after STREAM_MAX_FAILURES."""
+    attempt = 0
+    failures = 0
+    while failures < STREAM_MAX_FAILURES:
+        seen = {"events": 0}
+        stops = STOPS
+        try:
+            _consume_stream(*stops, seen)
+            if STOPS != stops:
+                attempt = failures = 0
+                continue  # /config switched stops; reconnect right away
+            log.info("Prediction stream closed by server")
+        except Exception as e:
+            log.warning("Prediction stream error: %s", e)
+        finally:
+            with _stream_lock:
+                _stream_cache["live"] = False
+
+        if seen["events"]:
+            attempt = failures = 0  # connection was healthy before it dropped
+        failures += 1
+        delay = min(60, 2 ** attempt + random.random())
+        attempt += 1
+        time.sleep(delay)
+
+    log.warning("Prediction stream unavailable; falling back to polling")
+
 # =======================
 # Alert decision logic
 # =======================
+# Alert ladders: the first rung (in priority order) with threshold >= secs wins.
+# Rebuilt by /config when thresholds change.
+_ORIGIN_LADDER = ((), ())  # (bounds, labels)
+_DEST_LADDER = ((), ())
+
+def _build_ladder(rungs):
+    """
+    rungs: (threshold, label) in priority order (first match wins, as an if/elif chain).
+    Keeps only rungs whose threshold exceeds every earlier one (the rest can never be
+    the first match), so bounds come out strictly increasing and bisect keeps priority.
+    """
+    bounds, labels = [], []
+    for threshold, label in rungs:
+        if not bounds or threshold > bounds[-1]:
+            bounds.append(threshold)
+            labels.append(label)
+    return tuple(bounds), tuple(labels)
+
+def _rebuild_ladders():
+    global _ORIGIN_LADDER, _DEST_LADDER
+    _ORIGIN_LADDER = _build_ladder([(30, "URGENT"),
+                                    (ORIGIN_STOP_THRESHOLD, "ORIGIN_STOP"),
+                                    (ORIGIN_APPROACH_THRESHOLD, "ORIGIN_APPROACH"),
+                                    (ORIGIN_NEARBY_THRESHOLD, "ORIGIN_NEARBY")])
+    _DEST_LADDER = _build_ladder([(60, "URGENT"),
+                                  (DEST_STOP_THRESHOLD, "DEST_STOP"),
+                                  (DEST_APPROACH_THRESHOLD, "DEST_APPROACH"),
+                                  (DEST_NEARBY_THRESHOLD, "DEST_NEARBY")])
+
+_rebuild_ladders()
+
+def _ladder_lookup(ladder, secs):
+    if secs is None: return "IDLE"
+    bounds, labels = ladder
+    i = bisect_left(bounds, secs)
+    return labels[i] if i < len(bounds) else "IDLE"
+
 def check_origin_alerts(origin_secs):
-    if origin_secs is None: return "IDLE"
-    if origin_secs <= 30:                      return "URGENT"
-    if origin_secs <= ORIGIN_STOP_THRESHOLD:   return "ORIGIN_STOP"
-    if origin_secs <= ORIGIN_APPROACH_THRESHOLD:return "ORIGIN_APPROACH"
-    if origin_secs <= ORIGIN_NEARBY_THRESHOLD: return "ORIGIN_NEARBY"
-    return "IDLE"
+    return _ladder_lookup(_ORIGIN_LADDER, origin_secs)
 
 def check_dest_alerts(dest_secs):
-    if dest_secs is None: return "IDLE"
-    if dest_secs <= 60:                   return "URGENT"
-    if dest_secs <= DEST_STOP_THRESHOLD:  return "DEST_STOP"
-    if dest_secs <= DEST_APPROACH_THRESHOLD:return "DEST_APPROACH"
-    if dest_secs <= DEST_NEARBY_THRESHOLD:return "DEST_NEARBY"
-    return "IDLE"
+    return _ladder_lookup(_DEST_LADDER, dest_secs)
 
 # =======================
 # Poller (runs in thread)
 # =======================
 def poll_loop():
-    global current_status, last_origin_secs, last_dest_secs, last_trip_id, last_updated_iso
-    global last_origin_alert, last_dest_alert
-
-    print("Starting transit alert poller")
-    if not SIM_MODE and not (arduino_connection and arduino_connection.is_open):
+    log.info("Starting transit alert poller")
+    conn = arduino_connection
+    if not SIM_MODE and not (conn and conn.is_open):
         connect_to_arduino(wait_ready=True)  # best-effort
 
     while True:
+        tick_start = time.monotonic()
+        o_secs = d_secs = None
         try:
-            # Trip-matched ETAs
+            now = datetime.now(timezone.utc)  # one clock read per tick
+
+            # Trip-matched ETAs: from the live stream when it's up, otherwise one HTTP fetch
             try:
-                o_secs, d_secs, trip_id = match_origin_dest_by_trip(ORIGIN_STOP, DEST_STOP)
+                o_stop, d_stop = STOPS
+                if _stream_live(o_stop, d_stop):
+                    o_secs, d_secs, trip_id = _match_raw(_stream_snapshot(), o_stop, d_stop, now)
+                else:
+                    o_secs, d_secs, trip_id = match_origin_dest_by_trip(o_stop, d_stop, now)
+            except requests.exceptions.Timeout as e:
+                log.warning("MBTA predictions timed out: %s", e)
+                o_secs, d_secs, trip_id = (None, None, None)
             except Exception as e:
-                print(f"Prediction fetch/match error: {e}")
+                log.error("Prediction fetch/match error: %s", e)
                 o_secs, d_secs, trip_id = (None, None, None)
 
-            last_origin_secs = o_secs
-            last_dest_secs   = d_secs
-            last_trip_id     = trip_id
-            last_updated_iso = datetime.now(timezone.utc).isoformat()
-
-            # UI badge status (simple)
-            next_status = "IDLE"
-            if o_secs is not None and o_secs <= NEARBY_THRESHOLD_SEC:
-                next_status = "NEARBY"
-            if d_secs is not None and d_secs <= APPROACH_THRESHOLD_SEC:
-                next_status = "APPROACH"
-            if d_secs is not None and d_secs <= STOP_THRESHOLD_SEC:
-                next_status = "STOP"
-            current_status = next_status
-
-            # Compute Arduino alerts (change-driven)
-            origin_alert = check_origin_alerts(o_secs)
-            dest_alert   = check_dest_alerts(d_secs)
-
-            if origin_alert != last_origin_alert:
-                _doorbell()
-                if origin_alert == "URGENT": send_urgent_alert()
-                elif origin_alert != "IDLE": send_alert(origin_alert)
-                else: send_alert("IDLE")
-                last_origin_alert = origin_alert
-                if o_secs is not None:
-                    print(f"🚉 Origin {int(o_secs)}s → {origin_alert}")
-
-            if dest_alert != last_dest_alert:
-                _doorbell()
-                if dest_alert == "URGENT": send_urgent_alert()
-                elif dest_alert != "IDLE": send_alert(dest_alert)
-                else: send_alert("IDLE")
-                last_dest_alert = dest_alert
-                if d_secs is not None:
-                    print(f"🎯 Dest {int(d_secs)}s → {dest_alert}")
-
-            # Update LED orientation every loop
-            send_led_status_update(o_secs, d_secs)
-
-            print("---")
+            _apply_etas(o_secs, d_secs, trip_id, now)
+            log.debug("---")
         except Exception as e:
-            print(f"Poll loop error: {e}")
+            log.error("Poll loop error: %s", e)
+
+        # Period is measured from tick start, so a slow MBTA response shortens the wait
+        # instead of stretching the cadence. If a tick overran, the next one starts at once
+        # (deadline is re-anchored per tick, so there's no catch-up burst).
+        # Wake early when the stream delivers a change; short settle so bursts of deltas coalesce
+        deadline = tick_start + _next_poll_delay(o_secs, d_secs)
+        if _stream_wake.wait(max(0.0, deadline - time.monotonic())):
+            time.sleep(1.0)
+        _stream_wake.clear()
+
+def _next_poll_delay(o_secs, d_secs):
+    """Poll faster as the soonest ETA nears the thresholds: soonest/6, clamped to [2s, POLL_INTERVAL]."""
+    soonest = min((x for x in (o_secs, d_secs) if x is not None), default=600)
+    return max(MIN_POLL_INTERVAL, min(POLL_INTERVAL, soonest / 6))
+
+def _apply_etas(o_secs, d_secs, trip_id, now=None):
+    """Publish ETAs for the UI and drive change-based Arduino alerts."""
+    prev = STATE
+
+    # UI badge status (simple)
+    next_status = "IDLE"
+    if o_secs is not None and o_secs <= NEARBY_THRESHOLD_SEC:
+        next_status = "NEARBY"
+    if d_secs is not None and d_secs <= APPROACH_THRESHOLD_SEC:
+        next_status = "APPROACH"
+    if d_secs is not None and d_secs <= STOP_THRESHOLD_SEC:
+        next_status = "STOP"
+
+    # Compute Arduino alerts (change-driven)
+    origin_alert = check_origin_alerts(o_secs)
+    dest_alert   = check_dest_alerts(d_secs)
+
+    _publish_state(
+        status=next_status,
+        origin_secs=o_secs,
+        dest_secs=d_secs,
+        trip_id=trip_id,
+        last_updated=(now or datetime.now(timezone.utc)).isoformat(),
+        origin_alert=origin_alert,
+        dest_alert=dest_alert,
+    )
+
+    # Everything this tick sends (tones, alerts, LED) goes out as one serial frame
+    frame = []
+    if origin_alert != prev["origin_alert"]:
+        frame += _doorbell() + [origin_alert]
+        if o_secs is not None:
+            log.info("🚉 Origin %ds → %s", o_secs, origin_alert)
+
+    if dest_alert != prev["dest_alert"]:
+        frame += _doorbell() + [dest_alert]
+        if d_secs is not None:
+            log.info("🎯 Dest %ds → %s", d_secs, dest_alert)
+
+    # LED orientation (only when the sooner side flipped)
+    led_cmd = _led_status_cmd(o_secs, d_secs)
+    if led_cmd:
+        frame.append(led_cmd)
 
-        time.sleep(POLL_INTERVAL)
+    if frame:
+        _enqueue_cmds(frame)
+        if log.isEnabledFor(logging.INFO):
+            log.info("🔔 ALERT → %s", " | ".join(frame))
 
 # =======================
 # KeyRoute Session logic (added)
@@ -396,7 +987,65 @@ class Session:
         self.boarded_ts     = None
         self.last_emitted_state = None
 
-sessions = {}  # session_id -> Session
+class SessionStore:
+    """
+    Bounded session_id -> Session map with per-entry deadlines. Expired entries read
+    as missing; when full, the oldest entry is evicted.
+    """
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl     = ttl
+        self._data   = OrderedDict()  # session_id -> (deadline, Session)
+        self._lock   = threading.Lock()
+
+    def put(self, session: Session, ttl=None):
+        deadline = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[session.id] = (deadline, session)
+            self._data.move_to_end(session.id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get(self, session_id):
+        with self._lock:
+            entry = self._data.get(session_id)
+            if not entry:
+                return None
+            if time.monotonic() >= entry[0]:
+                del self._data[session_id]
+                return None
+            return entry[1]
+
+    def expire(self):
+        now = time.monotonic()
+        with self._lock:
+            for sid in [sid for sid, (deadline, _) in self._data.items() if now >= deadline]:
+                del self._data[sid]
+
+    def __len__(self):
+        return len(self._data)
+
+sessions = SessionStore(maxsize=SESSION_MAX, ttl=SESSION_TTL_SEC)
+
+def _session_reaper():
+    while True:
+        time.sleep(60)
+        sessions.expire()
+
+def _session_or_404(session_id):
+    s = sessions.get(session_id)
+    if s is None:
+        return None, (jsonify({"error": "unknown or expired session"}), 404)
+    return s, None
+
+# KeyRoute state -> device cue (an alert/LED command + a short tone), in the .ino vocabulary
+_STATE_CUES = {
+    "AWAITING_BOARD":   ("ORIGIN_NEARBY", "BUZZ 800 60"),     # gentle cue: tracking started (origin-side)
+    "ONBOARD":          ("IDLE",          "BUZZ 600 40"),     # quiet the origin cues
+    "APPROACHING_DEST": ("DEST_APPROACH", "BUZZ 1000 150"),   # destination approaching
+    "ARRIVED":          ("DEST_STOP",     "BUZZ 1200 350"),   # destination reached
+}
+_CMD_CACHE.update({c: (c + "\n").encode() for cue in _STATE_CUES.values() for c in cue})
 
 def emit_state_change(session: Session, new_state: str):
     """Fire hardware cues on KeyRoute transitions (maps into your Arduino command set)."""
@@ -404,79 +1053,191 @@ def emit_state_change(session: Session, new_state: str):
         return
     session.last_emitted_state = new_state
 
-    # Map simple states into your device's existing command vocabulary
-    if new_state == "AWAITING_BOARD":
-        # Gentle cue to indicate tracking started (origin-side)
-        _arduino_write("ORIGIN_NEARBY")
-        _arduino_write("BUZZ 800 60")
-    elif new_state == "ONBOARD":
-        # Quiet the origin cues
-        _arduino_write("IDLE")
-        _arduino_write("BUZZ 600 40")
-    elif new_state == "APPROACHING_DEST":
-        # Destination approaching cue
-        _arduino_write("DEST_APPROACH")
-        _arduino_write("BUZZ 1000 150")
-    elif new_state == "ARRIVED":
-        # Destination reached cue
-        _arduino_write("DEST_STOP")
-        _arduino_write("BUZZ 1200 350")
+    cue = _STATE_CUES.get(new_state)
+    if cue:
+        _enqueue_cmds(cue)  # one atomic enqueue, so the pair shares a serial frame
 
 # =======================
 # Flask API (ALL endpoints)
 # =======================
+class OrjsonProvider(DefaultJSONProvider):
+    """jsonify via orjson (bytes straight into the response, no str round-trip)."""
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_SORT_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=orjson.OPT_SORT_KEYS)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
 app = Flask(__name__)
+if orjson:
+    app.json = OrjsonProvider(app)
 CORS(app)
 
+def _with_cache_control(resp, value):
+    resp.headers["Cache-Control"] = value
+    return resp
+
 # ---- BuzzBand (original) endpoints ----
+# Encoded /health body, reused for HEALTH_CACHE_SEC. Dropped early on Arduino
+# connect/disconnect and /config so the fields that matter never lag.
+HEALTH_CACHE_SEC = 5.0
+_health_cache = {"body": None, "ts": 0.0}
+
+def _invalidate_health():
+    _health_cache["body"] = None
+
 @app.route("/health")
 def health():
-    connected = bool(arduino_connection and arduino_connection.is_open)
-    mode = "arduino" if connected and not SIM_MODE else "sim"
-    return jsonify({
-        "status": "ok",
-        "mode": mode,
-        "arduino": "connected" if connected else "not-connected",
-        "origin_stop": ORIGIN_STOP,
-        "dest_stop": DEST_STOP
-    })
+    now = time.monotonic()
+    body = _health_cache["body"]
+    if body is None or now - _health_cache["ts"] >= HEALTH_CACHE_SEC:
+        conn = arduino_connection  # one read: the writer thread may reset it to None
+        connected = bool(conn and conn.is_open)
+        origin_stop, dest_stop = STOPS
+        mode = "arduino" if connected and not SIM_MODE else "sim"
+        body = _json_dumpb({
+            "status": "ok",
+            "mode": mode,
+            "arduino": "connected" if connected else "not-connected",
+            "origin_stop": origin_stop,
+            "dest_stop": dest_stop,
+            "last_fetch": dict(_last_fetch)
+        })
+        _health_cache.update(body=body, ts=now)
+    return _with_cache_control(app.response_class(body, mimetype="application/json"),
+                               "public, max-age=5")
+
+# UI badge thresholds are env-only (not touched by /config), so build this once
+_STATUS_THRESHOLDS = {
+    "nearby": NEARBY_THRESHOLD_SEC,
+    "approach": APPROACH_THRESHOLD_SEC,
+    "stop": STOP_THRESHOLD_SEC
+}
 
 @app.route("/status")
 def status():
-    return jsonify({
-        "status": current_status,
-        "origin_secs": last_origin_secs,
-        "dest_secs": last_dest_secs,
-        "trip_id": last_trip_id,
-        "last_updated": last_updated_iso,
-        "thresholds": {
-            "nearby": NEARBY_THRESHOLD_SEC,
-            "approach": APPROACH_THRESHOLD_SEC,
-            "stop": STOP_THRESHOLD_SEC
-        }
-    })
+    st = STATE  # one consistent snapshot
+    if st["etag"] in request.if_none_match:
+        resp = app.response_class(status=304)
+        resp.set_etag(st["etag"])
+        return _with_cache_control(resp, "public, max-age=1, stale-while-revalidate=5")
+    resp = jsonify(_status_payload(st))
+    resp.set_etag(st["etag"])
+    return _with_cache_control(resp, "public, max-age=1, stale-while-revalidate=5")
+
+def _status_payload(st):
+    return {
+        "status": st["status"],
+        "origin_secs": st["origin_secs"],
+        "dest_secs": st["dest_secs"],
+        "trip_id": st["trip_id"],
+        "last_updated": st["last_updated"],
+        "thresholds": _STATUS_THRESHOLDS
+    }
+
+SSE_KEEPALIVE_SEC = 15
+SSE_MAX_STREAMS   = int(os.getenv("SSE_MAX_STREAMS", "3"))        # well below the server's 8 threads
+SSE_MAX_LIFETIME_SEC = int(os.getenv("SSE_MAX_LIFETIME_SEC", "300"))  # then the client reconnects
+_sse_slots = threading.BoundedSemaphore(SSE_MAX_STREAMS)
+
+@app.route("/events/stream")
+def status_stream():
+    """
+    Server-Sent Events: pushes the /status payload each time the poller publishes, instead
+    of the frontend polling /status. Each open stream holds one server thread, so at most
+    SSE_MAX_STREAMS are served at once (503 beyond that) and each ends after SSE_MAX_LIFETIME_SEC.
+    """
+    if not _sse_slots.acquire(blocking=False):
+        resp = jsonify({"ok": False, "error": "too many event streams; poll /status"})
+        resp.headers["Retry-After"] = str(SSE_KEEPALIVE_SEC)
+        return resp, 503
+
+    def gen():
+        last = None
+        deadline = time.monotonic() + SSE_MAX_LIFETIME_SEC
+        yield b"retry: 1000\n\n"  # reconnect promptly when the lifetime runs out
+        while time.monotonic() < deadline:
+            with _state_cv:
+                if STATE["etag"] == last:
+                    _state_cv.wait(timeout=SSE_KEEPALIVE_SEC)
+                st = STATE
+            if st["etag"] == last:
+                yield b": keep-alive\n\n"  # comment line; keeps proxies from timing out
+                continue
+            last = st["etag"]
+            yield b"id: %s\ndata: %s\n\n" % (last.encode(), _json_dumpb(_status_payload(st)))
+
+    resp = app.response_class(gen(), mimetype="text/event-stream")
+    # Released when the server closes the response (lifetime over or client gone),
+    # even if the generator never started
+    resp.call_on_close(_sse_slots.release)
+    resp.headers["Cache-Control"] = "no-cache, no-transform"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
 
 @app.route("/sim")
 def sim_state():
     return jsonify({"sim_forced": SIM_MODE, "last": sim_last_cmd})
 
+# Self-tests run off the request thread: a synchronous write may have to reconnect
+# (board reset + banner wait), which would otherwise hold the worker for seconds.
+_selftest_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="selftest")
+_selftest_jobs: "OrderedDict[str, Future]" = OrderedDict()  # job_id -> Future[write mode], newest last
+_selftest_lock = threading.Lock()
+_SELFTEST_JOBS_MAX = 32
+_SELFTEST_SEQ = (
+    "ORIGIN_NEARBY", "ORIGIN_APPROACH", "ORIGIN_STOP",
+    "DEST_NEARBY",   "DEST_APPROACH",   "DEST_STOP"
+)
+# doorbell-ish tones
+_SELFTEST_TONES = ("BUZZ 880 150", "BUZZ 988 150", "BUZZ 1175 250")
+_CMD_CACHE.update({c: (c + "\n").encode() for c in _SELFTEST_TONES})
+
+def _selftest_write():
+    """Write the self-test frame; returns the write mode, since every path reports success."""
+    lines = _SELFTEST_SEQ + _SELFTEST_TONES
+    with _serial_lock:
+        _raw_write_locked("\n".join(lines), b"".join(map(_encode_cmd, lines)))
+        return last_write_mode
+
 @app.route("/selftest", methods=["POST"])
 def selftest():
-    """Quick sequence of alerts + tones to validate device link (works in SIM too)."""
-    seq = [
-        "ORIGIN_NEARBY", "ORIGIN_APPROACH", "ORIGIN_STOP",
-        "DEST_NEARBY",   "DEST_APPROACH",   "DEST_STOP"
-    ]
-    ok_all = True
-    for cmd in seq:
-        ok = _arduino_write(cmd)
-        ok_all = ok_all and ok
-        time.sleep(0.3)
-    # doorbell-ish tones
-    _arduino_write("BUZZ 880 150");   time.sleep(0.08)
-    _arduino_write("BUZZ 988 150");   time.sleep(0.08)
-    _arduino_write("BUZZ 1175 250")
-    return jsonify({"ok": ok_all, "sequence": seq})
+    """Quick sequence of alerts + tones to validate device link (works in SIM too). Returns 202 + job_id."""
+    # One frame, written directly so the job result reflects the real write; the sketch
+    # plays each line to completion before reading the next, so no sleeps here.
+    fut = _selftest_pool.submit(_selftest_write)
+    job_id = uuid.uuid4().hex
+    with _selftest_lock:
+        _selftest_jobs[job_id] = fut
+        while len(_selftest_jobs) > _SELFTEST_JOBS_MAX:
+            _selftest_jobs.popitem(last=False)
+    return jsonify({"ok": True, "job_id": job_id, "sequence": list(_SELFTEST_SEQ)}), 202
+
+@app.get("/selftest/<job_id>")
+def selftest_status(job_id):
+    """ok: the frame went to the device (or forced SIM); a silent fallback to SIM reports ok=false."""
+    with _selftest_lock:
+        fut = _selftest_jobs.get(job_id)
+    if fut is None:
+        return jsonify({"ok": False, "error": "unknown job"}), 404
+    if not fut.done():
+        return jsonify({"job_id": job_id, "done": False})
+    err = fut.exception()
+    mode = None if err else fut.result()
+    return jsonify({"job_id": job_id, "done": True, "ok": mode in ("arduino", "sim"), "mode": mode,
+                    "error": str(err) if err else ("device not reachable" if mode == "sim-fallback" else None)})
+
+# /buzz command vocabulary
+_EXT_COMMANDS = frozenset({"URGENT", "IDLE", "STATUS_UPDATE", "LED_STATUS_ORIGIN", "LED_STATUS_DEST", "LED_STATUS_NONE"})
+_EXT_PREFIXES = ("ORIGIN_", "DEST_")
+_LEGACY_CMDS  = frozenset({"NEARBY", "APPROACH", "STOP", "IDLE"})
+BUZZ_FREQ_MIN, BUZZ_FREQ_MAX = 31, 8000   # Hz (tone() floor on AVR)
+BUZZ_DUR_MIN,  BUZZ_DUR_MAX  = 10, 2000   # ms
 
 @app.route("/buzz", methods=["POST"])
 def buzz():
@@ -494,9 +1255,13 @@ def buzz():
     if "freq_hz" in data and "duration_ms" in data:
         try:
             freq = int(data["freq_hz"]); dur = int(data["duration_ms"])
-            sent = _arduino_write(f"BUZZ {freq} {dur}")
-            status_code = 200 if sent else 503
-            return jsonify({"ok": sent, "pattern": {"freq_hz": freq, "duration_ms": dur}}), status_code
+            if freq < 0 or dur < 0:
+                return jsonify({"ok": False, "error": "freq_hz and duration_ms must be non-negative"}), 400
+            # Clamp to what the piezo/tone() can do; also keeps the serial frame short
+            freq = max(BUZZ_FREQ_MIN, min(BUZZ_FREQ_MAX, freq))
+            dur = max(BUZZ_DUR_MIN, min(BUZZ_DUR_MAX, dur))
+            _enqueue_cmd(f"BUZZ {freq} {dur}")
+            return jsonify({"ok": True, "pattern": {"freq_hz": freq, "duration_ms": dur}})
         except Exception as e:
             return jsonify({"ok": False, "error": str(e)}), 400
 
@@ -507,43 +1272,79 @@ def buzz():
         return jsonify({"ok": False, "error": "missing command"}), 400
 
     # Extended commands → send as-is
-    if any(cmd.startswith(prefix) for prefix in ("ORIGIN_", "DEST_")) or cmd in {
-        "URGENT","IDLE","STATUS_UPDATE","LED_STATUS_ORIGIN","LED_STATUS_DEST","LED_STATUS_NONE"
-    }:
-        sent = _arduino_write(cmd)
-        return jsonify({"ok": sent, "sent": cmd}), (200 if sent else 503)
+    if cmd.startswith(_EXT_PREFIXES) or cmd in _EXT_COMMANDS:
+        _enqueue_cmd(cmd)
+        return jsonify({"ok": True, "sent": cmd})
 
     # Legacy generic → map to ORIGIN_* or DEST_* (default origin)
-    if cmd in {"NEARBY","APPROACH","STOP","IDLE"}:
+    if cmd in _LEGACY_CMDS:
         mapped = "IDLE" if cmd == "IDLE" else f"{'ORIGIN' if scope!='dest' else 'DEST'}_{cmd}"
-        sent = _arduino_write(mapped)
-        return jsonify({"ok": sent, "sent": mapped}), (200 if sent else 503)
+        _enqueue_cmd(mapped)
+        return jsonify({"ok": True, "sent": mapped})
 
     return jsonify({"ok": False, "error": "unknown command"}), 400
 
+# /config "thresholds" keys -> module globals feeding the alert ladders
+_CONFIG_THRESHOLDS = {
+    "origin_nearby":   "ORIGIN_NEARBY_THRESHOLD",
+    "origin_approach": "ORIGIN_APPROACH_THRESHOLD",
+    "origin_stop":     "ORIGIN_STOP_THRESHOLD",
+    "dest_nearby":     "DEST_NEARBY_THRESHOLD",
+    "dest_approach":   "DEST_APPROACH_THRESHOLD",
+    "dest_stop":       "DEST_STOP_THRESHOLD",
+}
+CONFIG_THRESHOLD_MAX = 86400  # seconds; also keeps values inside JSON-encodable int range
+
 @app.route("/config", methods=["POST"])
 def config():
-    global ORIGIN_STOP, DEST_STOP
+    global STOPS
     data = request.get_json(silent=True) or {}
-    if "origin_stop" in data: ORIGIN_STOP = str(data["origin_stop"])
-    if "dest_stop"   in data: DEST_STOP   = str(data["dest_stop"])
-    return jsonify({"ok": True, "origin_stop": ORIGIN_STOP, "dest_stop": DEST_STOP})
+
+    # Validate everything first so a bad request changes nothing
+    parsed = {}
+    thresholds = data.get("thresholds") or {}
+    if thresholds:
+        try:
+            parsed = {k: max(0, int(v)) for k, v in thresholds.items()}
+        except (TypeError, ValueError, AttributeError):
+            return jsonify({"ok": False, "error": "thresholds must be integer seconds"}), 400
+        unknown = sorted(set(parsed) - set(_CONFIG_THRESHOLDS))
+        if unknown:
+            return jsonify({"ok": False, "error": f"unknown thresholds: {', '.join(unknown)}"}), 400
+        if any(v > CONFIG_THRESHOLD_MAX for v in parsed.values()):
+            return jsonify({"ok": False, "error": f"thresholds must be at most {CONFIG_THRESHOLD_MAX} seconds"}), 400
+
+    with _state_lock:  # serialize concurrent /config writers
+        origin_stop, dest_stop = STOPS
+        if "origin_stop" in data: origin_stop = str(data["origin_stop"])
+        if "dest_stop"   in data: dest_stop   = str(data["dest_stop"])
+        STOPS = (origin_stop, dest_stop)
+        _invalidate_health()
+        if parsed:
+            for key, val in parsed.items():
+                globals()[_CONFIG_THRESHOLDS[key]] = val
+            _rebuild_ladders()
+        current = {k: globals()[v] for k, v in _CONFIG_THRESHOLDS.items()}
+
+    return jsonify({"ok": True, "origin_stop": origin_stop, "dest_stop": dest_stop,
+                    "thresholds": current})
 
 @app.route("/events")
 def events():
-    return jsonify({"events": event_log[-50:]})
+    return _with_cache_control(jsonify({"events": list(event_log)[-50:]}), "public, max-age=10")
 
 # ---- KeyRoute endpoints (added) ----
 
 def mbta_get_json(path, params):
-    """Shared helper for stops/search + arrivals."""
+    """Shared helper for stops/search + arrivals (TTL-cached per path, see MBTA_CACHE_TTL)."""
+    return _mbta_cached(path, params, lambda: _mbta_fetch_json(path, params))
+
+def _mbta_fetch_json(path, params):
     url = f"https://api-v3.mbta.com{path}"
-    headers = {"accept":"application/json"}
-    if API_KEY:
-        headers["x-api-key"] = API_KEY
-    r = requests.get(url, params=params, headers=headers, timeout=12)
+    # API key + gzip come from MBTA_SESSION's default headers
+    r = MBTA_SESSION.get(url, params=params, headers={"accept": "application/json"}, timeout=MBTA_TIMEOUT)
     r.raise_for_status()
-    return r.json()
+    return _json_loads(r.content)
 
 @app.post("/session")
 def create_session():
@@ -554,7 +1355,7 @@ def create_session():
         dest_stop_id=data["dest_stop_id"],
         route_id=data.get("route_id"),
     )
-    sessions[s.id] = s
+    sessions.put(s)
     emit_state_change(s, s.state)  # green/tiny cue
     return jsonify({"session_id": s.id, "state": s.state})
 
@@ -566,40 +1367,45 @@ def arrivals():
     if not origin_stop_id:
         return jsonify({"arrivals": []})
 
+    limit = 3
     params = {
         "filter[stop]": origin_stop_id,
         "sort": "departure_time",
-        "page[limit]": 3,
-        "include": "trip,route"
+        "page[limit]": limit,
+        "include": "trip"  # only headsign is read; routes would just bloat `included`
     }
     if route_id:
         params["filter[route]"] = route_id
 
     data = mbta_get_json("/predictions", params)
-    included = {item["id"]: item for item in data.get("included", [])}
+    trips = None  # trip id -> included trip; built on first use, trips only
+    parse = _parse_epoch
     out = []
+    append = out.append
     now = time.time()
     for p in data.get("data", []):
-        attrs = p.get("attributes", {})
-        dep_iso = attrs.get("departure_time") or attrs.get("arrival_time")
-        if not dep_iso:
+        attrs = p.get("attributes") or _EMPTY
+        dep_epoch = parse(attrs.get("departure_time") or attrs.get("arrival_time"))
+        if not dep_epoch:
             continue
-        dep_dt = parse_time(dep_iso)
-        if not dep_dt:
-            continue
-        dep_epoch = dep_dt.timestamp()
-        eta_sec = max(0, int(dep_epoch - now))
-        trip_rel = p.get("relationships", {}).get("trip", {}).get("data")
+        dep_int = int(dep_epoch)
+        trip_rel = ((p.get("relationships") or _EMPTY).get("trip") or _EMPTY).get("data")
         trip_id = trip_rel["id"] if trip_rel else None
         headsign = None
-        if trip_id and trip_id in included and included[trip_id]["type"] == "trip":
-            headsign = included[trip_id]["attributes"].get("headsign")
-        out.append({
-            "trip_id": trip_id or f"UNKNOWN_{int(dep_epoch)}",
+        if trip_id:
+            if trips is None:
+                trips = {it["id"]: it for it in data.get("included", ()) if it.get("type") == "trip"}
+            inc = trips.get(trip_id)
+            if inc:
+                headsign = (inc.get("attributes") or _EMPTY).get("headsign")
+        append({
+            "trip_id": trip_id or "UNKNOWN_" + str(dep_int),
             "headsign": headsign or "Towards destination",
-            "dep_epoch": int(dep_epoch),
-            "eta_sec": eta_sec
+            "dep_epoch": dep_int,
+            "eta_sec": max(0, int(dep_epoch - now))
         })
+        if len(out) >= limit:
+            break
 
     return jsonify({"arrivals": out})
 
@@ -607,65 +1413,140 @@ def arrivals():
 def board_trip():
     """User confirms they boarded a specific trip_id."""
     data = request.get_json(force=True)
-    s = sessions[data["session_id"]]
+    s, err = _session_or_404(data.get("session_id"))
+    if err:
+        return err
     s.trip_id = data["trip_id"]
     s.state = "ONBOARD"
     s.boarded_ts = time.time()
     emit_state_change(s, s.state)  # quiet origin cues
     return jsonify({"ok": True, "state": s.state, "trip_id": s.trip_id})
 
-def eta_for_trip_to_stop(trip_id, dest_stop_id):
-    """Ask MBTA for ETA for a given trip to reach dest_stop."""
-    if not trip_id:
-        return None
+def _first_eta(items, now):
+    """ETA (secs, floored at 0) of the first item carrying an arrival/departure time."""
+    arr_ts = next(filter(None, map(_item_epoch, items)), None)  # lazy: stops at the first hit
+    return None if arr_ts is None else max(0, int(arr_ts - now))
+
+def _eta_single(trip_id, dest_stop_id):
     params = {
         "filter[trip]": trip_id,
         "filter[stop]": dest_stop_id,
         "sort": "arrival_time",
         "page[limit]": 1
     }
+    data = mbta_get_json("/predictions", params)
+    return _first_eta(data.get("data", []), time.time())
+
+class ETABatcher:
+    """
+    Coalesces concurrent (trip_id, dest_stop_id) ETA lookups into one
+    /predictions?filter[trip]=a,b&filter[stop]=x,y call.
+
+    The first caller to find the queue empty becomes the leader: it waits up to
+    batch_interval_ms (or until max_batch_size callers are queued), drains the
+    queue, fetches, and wakes everyone with their own result. A batch of one
+    takes the plain single-trip request.
+    """
+
+    def __init__(self, batch_interval_ms=50, max_batch_size=10):
+        self.batch_interval = batch_interval_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self._lock = threading.Lock()
+        self._pending = deque()
+        self._full = threading.Event()
+
+    def lookup(self, trip_id, dest_stop_id, timeout=15):
+        entry = {"key": (trip_id, dest_stop_id), "done": threading.Event(), "result": None}
+        with self._lock:
+            self._pending.append(entry)
+            leader = len(self._pending) == 1
+            if len(self._pending) >= self.max_batch_size:
+                self._full.set()
+
+        if leader:
+            self._full.wait(self.batch_interval)
+            with self._lock:
+                batch = list(self._pending)
+                self._pending.clear()
+                self._full.clear()
+            for i in range(0, len(batch), self.max_batch_size):
+                self._flush(batch[i:i + self.max_batch_size])
+
+        entry["done"].wait(timeout)
+        return entry["result"]
+
+    def _flush(self, batch):
+        try:
+            if len(batch) == 1:
+                batch[0]["result"] = _eta_single(*batch[0]["key"])
+                return
+
+            trip_ids = sorted({e["key"][0] for e in batch})
+            stop_ids = sorted({e["key"][1] for e in batch})
+            data = mbta_get_json("/predictions", {
+                "filter[trip]": ",".join(trip_ids),
+                "filter[stop]": ",".join(stop_ids),
+                "sort": "arrival_time",
+                "include": "stop",   # lets _bucket_by_stop map platforms to parent stations
+            })
+
+            # Demultiplex by (trip_id, requested stop)
+            now = time.time()
+            by_key = {}
+            for stop_id, items in _bucket_by_stop(data, stop_ids).items():
+                for item in items:
+                    trip = ((item.get("relationships") or _EMPTY).get("trip") or _EMPTY).get("data") or _EMPTY
+                    by_key.setdefault((trip.get("id"), stop_id), []).append(item)
+            for e in batch:
+                e["result"] = _first_eta(by_key.get(e["key"], []), now)
+        except Exception as e:
+            log.error("ETA batch error: %s", e)
+        finally:
+            for e in batch:
+                e["done"].set()
+
+_eta_batcher = ETABatcher()
+
+def eta_for_trip_to_stop(trip_id, dest_stop_id):
+    """Ask MBTA for ETA for a given trip to reach dest_stop (batched with concurrent callers)."""
+    if not trip_id:
+        return None
     try:
-        data = mbta_get_json("/predictions", params)
-        now = time.time()
-        for p in data.get("data", []):
-            attrs = p.get("attributes", {})
-            arr_iso = attrs.get("arrival_time") or attrs.get("departure_time")
-            if not arr_iso:
-                continue
-            arr_dt = parse_time(arr_iso)
-            if not arr_dt:
-                continue
-            return max(0, int(arr_dt.timestamp() - now))
+        return _eta_batcher.lookup(trip_id, dest_stop_id)
     except Exception as e:
-        print(f"eta_for_trip_to_stop error: {e}")
+        log.error("eta_for_trip_to_stop error: %s", e)
     return None
 
 @app.get("/progress")
 def progress():
     """Session progress: state + ETA to origin (pre-board) and ETA to destination."""
     session_id = request.args.get("session_id")
-    s = sessions[session_id]
+    s, err = _session_or_404(session_id)
+    if err:
+        return err
 
     now = time.time()
     if s.state == "AWAITING_BOARD":
         # While waiting to board, show countdowns from stubs (or you could call MBTA for origin live)
-        eta_origin = clamp_nonneg(s.stub_origin_eta - (now - s.created_ts))
-        eta_dest   = clamp_nonneg(s.stub_dest_eta   - (now - s.created_ts))
+        elapsed = now - s.created_ts
+        eta_origin = clamp_nonneg(s.stub_origin_eta - elapsed)
+        eta_dest   = clamp_nonneg(s.stub_dest_eta   - elapsed)
     else:
         # After boarding: origin disabled; destination uses real trip_id ETA
         eta_origin = None
         eta_dest = eta_for_trip_to_stop(s.trip_id, s.dest_stop_id)
         if eta_dest is None:
-            elapsed_onboard = now - (s.boarded_ts or now)
-            eta_dest = clamp_nonneg(1500 - elapsed_onboard)
+            eta_dest = clamp_nonneg(1500 - (now - (s.boarded_ts or now)))
 
-        # Transition to approaching/arrived based on real ETA where possible
-        if s.state == "ONBOARD" and eta_dest is not None and eta_dest <= 240:
+        # eta_dest is always set here. Transition to approaching/arrived; ONBOARD at 0s
+        # passes through APPROACHING_DEST first so both device cues fire.
+        if s.state == "ONBOARD" and eta_dest <= 240:
             s.state = "APPROACHING_DEST"
             emit_state_change(s, s.state)
-        if eta_dest is not None and eta_dest == 0 and s.state in ("ONBOARD", "APPROACHING_DEST"):
+        if s.state == "APPROACHING_DEST" and eta_dest == 0:
             s.state = "ARRIVED"
             emit_state_change(s, s.state)
+            sessions.put(s, ttl=SESSION_ARRIVED_TTL_SEC)  # trip done; keep it briefly for the UI
 
     return jsonify({
         "state": s.state,
@@ -674,12 +1555,46 @@ def progress():
         "trip_id": s.trip_id
     })
 
+# Shaped /stops/* responses, keyed on the normalized query. Stop geometry doesn't change
+# within a session, so typing the same search (or standing in the same spot) is a dict hit.
+STOPS_CACHE_TTL = int(os.getenv("STOPS_CACHE_TTL", "21600"))  # 6h; SIGHUP flushes (see __main__)
+STOPS_CACHE_MAX = 4096
+_stops_cache: "OrderedDict[tuple, tuple[float, list]]" = OrderedDict()  # key -> (expiry, stops)
+_stops_cache_lock = threading.Lock()
+
+def _flush_stops_cache(*_):
+    with _stops_cache_lock:
+        _stops_cache.clear()
+    # ...and the raw /stops responses behind it, or the rebuild would reuse them for a day
+    with _mbta_cache_lock:
+        for key in [k for k in _mbta_cache if k[0] == "/stops"]:
+            del _mbta_cache[key]
+    log.info("Stops cache flushed")
+
+def _stops_cached(key, build):
+    now = time.monotonic()
+    with _stops_cache_lock:
+        hit = _stops_cache.get(key)
+        if hit and now < hit[0]:
+            _stops_cache.move_to_end(key)
+            return hit[1]
+    stops = build()
+    with _stops_cache_lock:
+        _stops_cache[key] = (now + STOPS_CACHE_TTL, stops)
+        _stops_cache.move_to_end(key)
+        while len(_stops_cache) > STOPS_CACHE_MAX:
+            _stops_cache.popitem(last=False)
+    return stops
+
 @app.get("/stops/search")
 def stops_search():
     """Search stops by text (name)."""
-    q = (request.args.get("q") or "").strip()
+    q = " ".join((request.args.get("q") or "").split()).lower()
     if not q:
         return jsonify({"stops": []})
+    return jsonify({"stops": _stops_cached(("search", q), lambda: _search_stops(q))})
+
+def _search_stops(q):
     data = mbta_get_json("/stops", {
         "filter[search]": q,
         "page[limit]": 12,
@@ -694,7 +1609,7 @@ def stops_search():
             "lat": attrs.get("latitude"),
             "lon": attrs.get("longitude"),
         })
-    return jsonify({"stops": out})
+    return out
 
 @app.get("/stops/near")
 def stops_near():
@@ -705,6 +1620,13 @@ def stops_near():
     if lat is None or lon is None:
         return jsonify({"stops": []})
 
+    # Snap to ~11 m and the nearest 100 m radius so nearby requests share a cache entry
+    lat, lon = round(lat, 4), round(lon, 4)
+    radius_m = max(100, int(round(radius_m, -2)))
+    key = ("near", lat, lon, radius_m)
+    return jsonify({"stops": _stops_cached(key, lambda: _near_stops(lat, lon, radius_m))})
+
+def _near_stops(lat, lon, radius_m):
     data = mbta_get_json("/stops", {
         "filter[latitude]": lat,
         "filter[longitude]": lon,
@@ -722,16 +1644,49 @@ def stops_near():
             "lon": attrs.get("longitude"),
             "distance_m": attrs.get("distance"),
         })
-    return jsonify({"stops": out})
+    return out
 
 # =======================
 # Entrypoint
 # =======================
+_bg_started = False
+_bg_lock = threading.Lock()
+
 def start_background():
+    """Start the worker threads once per process (safe to call repeatedly)."""
+    global _bg_started
+    with _bg_lock:
+        if _bg_started:
+            return
+        _bg_started = True
+    threading.Thread(target=_serial_writer, daemon=True).start()
+    threading.Thread(target=_session_reaper, daemon=True).start()
+    if USE_STREAM:
+        threading.Thread(target=stream_loop, daemon=True).start()
     t = threading.Thread(target=poll_loop, daemon=True)
     t.start()
 
+@app.before_request
+def _ensure_background():
+    # Under an external WSGI server (e.g. `gunicorn -w 1 --threads 8 app:app`)
+    # __main__ never runs; start the workers on the first request instead.
+    # Keep to one worker process: sessions, event_log and the serial handle are per-process.
+    if not _bg_started:
+        start_background()
+
 if __name__ == "__main__":
+    dev = "--dev" in sys.argv[1:] or os.getenv("FLASK_DEBUG") == "1"
+    if dev and not os.getenv("LOG_LEVEL"):
+        log.setLevel(logging.INFO)
+    if hasattr(signal, "SIGHUP"):  # not on Windows
+        signal.signal(signal.SIGHUP, _flush_stops_cache)  # `kill -HUP <pid>` after editing stop data
     start_background()
     port = int(os.getenv("PORT", "5001"))
-    app.run(host="127.0.0.1", port=port, debug=True)
+    if dev:
+        # Werkzeug dev server; reloader off so the poller + serial threads start once
+        app.run(host="127.0.0.1", port=port, debug=True, use_reloader=False)
+    else:
+        from waitress import serve
+        # Keep-alive pollers share connections; idle ones are reaped after channel_timeout
+        serve(app, host="127.0.0.1", port=port, threads=8,
+              connection_limit=200, channel_timeout=30)